@@ -1,4 +1,8 @@
 import asyncio
+import atexit
+import concurrent.futures
+import functools
+import io
 import os
 import re
 import time
@@ -20,7 +24,12 @@ from telegram.ext import (
     ContextTypes,
     filters,
 )
-from generator import generate_qr, generate_barcode
+from generator import generate_both, warmup
+
+try:
+    import uvloop  # нет на Windows — локально работаем на стандартном event loop
+except ImportError:
+    uvloop = None
 
 load_dotenv()
 BOT_TOKEN        = os.getenv("BOT_TOKEN")
@@ -36,6 +45,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Генерация QR/штрихкода — чисто CPU-bound, в thread pool её сериализует GIL.
+# Пул процессов даёт параллелизм до cpu_count при одновременных запросах.
+_POOL = concurrent.futures.ProcessPoolExecutor(
+    max_workers=os.cpu_count(), initializer=warmup,
+)
+atexit.register(_POOL.shutdown)
+
 metricon: MetriconClient | None = None
 if METRICON_API_KEY:
     metricon = MetriconClient(
@@ -45,17 +61,36 @@ if METRICON_API_KEY:
     )
 
 
-def make_reply_keyboard() -> ReplyKeyboardMarkup | None:
-    """Постоянная кнопка над полем ввода для открытия формы утиля."""
-    if not WEBAPP_URL:
-        return None
-    util_url = f"{WEBAPP_URL.rstrip('/')}/util.html"
-    return ReplyKeyboardMarkup(
-        [[KeyboardButton("🖨 Друк інших наклейок", web_app=WebAppInfo(url=util_url))]],
+# URL и постоянная клавиатура статичны — собираем один раз при старте,
+# а не rstrip + f-string на каждое сообщение.
+_WEBAPP_BASE = WEBAPP_URL.rstrip("/") if WEBAPP_URL else ""
+
+_REPLY_KB: ReplyKeyboardMarkup | None = None
+if _WEBAPP_BASE:
+    # Постоянная кнопка над полем ввода для открытия формы утиля
+    _REPLY_KB = ReplyKeyboardMarkup(
+        [[KeyboardButton(
+            "🖨 Друк інших наклейок",
+            web_app=WebAppInfo(url=f"{_WEBAPP_BASE}/util.html"),
+        )]],
         resize_keyboard=True,
     )
 
 
+def _track(command: str, t0: float, update: Update,
+           success: bool, exc: Exception | None = None) -> None:
+    """Телеметрия через create_task + to_thread — хендлер не ждёт Metricon."""
+    if not metricon:
+        return
+    ms = int((time.monotonic() - t0) * 1000)
+    uid = str(update.effective_user.id)
+    asyncio.create_task(asyncio.to_thread(
+        metricon.track_request, command, ms, uid, success=success))
+    if exc is not None:
+        asyncio.create_task(asyncio.to_thread(
+            metricon.track_error, exc, command=command))
+
+
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     t0 = time.monotonic()
     try:
@@ -64,22 +99,35 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "• В чат — получишь QR и штрихкод файлами\n"
             "• На печать — откроется Mini App\n\n"
             "Кнопка «Друк інших наклейок» — внизу, над полем ввода.",
-            reply_markup=make_reply_keyboard(),
+            reply_markup=_REPLY_KB,
         )
-        if metricon:
-            metricon.track_request("/start", int((time.monotonic() - t0) * 1000),
-                                   str(update.effective_user.id), success=True)
+        _track("/start", t0, update, success=True)
     except Exception as exc:
-        if metricon:
-            metricon.track_request("/start", int((time.monotonic() - t0) * 1000),
-                                   str(update.effective_user.id), success=False)
-            metricon.track_error(exc, command="/start")
+        _track("/start", t0, update, success=False, exc=exc)
         raise
 
 
+_SERIAL_PREFIX_RE = re.compile(r'^[^\w\-]+')
+
+
 def clean_serial(text: str) -> str:
     """Убрать служебные символы, которые добавляют некоторые сканеры (напр. '[')."""
-    return re.sub(r'^[^\w\-]+', '', text.strip())
+    return _SERIAL_PREFIX_RE.sub('', text.strip())
+
+
+@functools.lru_cache(maxsize=2048)
+def _serial_markup(serial: str) -> InlineKeyboardMarkup:
+    """Markup для серийника неизменяем с точки зрения PTB — кэшируем и переиспользуем."""
+    buttons = [[InlineKeyboardButton("📎 В чат", callback_data="send_to_chat")]]
+    if _WEBAPP_BASE:
+        qs = urlencode({"data": serial})
+        buttons[0].append(
+            InlineKeyboardButton(
+                "🖨 На печать",
+                web_app=WebAppInfo(url=f"{_WEBAPP_BASE}/index.html?{qs}"),
+            )
+        )
+    return InlineKeyboardMarkup(buttons)
 
 
 async def handle_serial(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -90,32 +138,44 @@ async def handle_serial(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         # Сохраняем серийник для callback
         context.user_data["serial"] = serial
 
-        buttons = [[InlineKeyboardButton("📎 В чат", callback_data="send_to_chat")]]
-        if WEBAPP_URL:
-            base = WEBAPP_URL.rstrip("/")
-            qs = urlencode({"data": serial})
-            buttons[0].append(
-                InlineKeyboardButton(
-                    "🖨 На печать",
-                    web_app=WebAppInfo(url=f"{base}/index.html?{qs}"),
-                )
-            )
-
         await update.message.reply_text(
             serial,
-            reply_markup=InlineKeyboardMarkup(buttons),
+            reply_markup=_serial_markup(serial),
         )
-        if metricon:
-            metricon.track_request("/serial", int((time.monotonic() - t0) * 1000),
-                                   str(update.effective_user.id), success=True)
+        _track("/serial", t0, update, success=True)
     except Exception as exc:
-        if metricon:
-            metricon.track_request("/serial", int((time.monotonic() - t0) * 1000),
-                                   str(update.effective_user.id), success=False)
-            metricon.track_error(exc, command="/serial")
+        _track("/serial", t0, update, success=False, exc=exc)
         raise
 
 
+# Telegram возвращает file_id на каждую загрузку — повторную отправку того же
+# PNG любому пользователю можно сделать по file_id без re-upload
+_FILE_ID_CACHE: dict[tuple[str, str], str] = {}
+_FILE_ID_CACHE_MAX = 2048
+
+
+async def _send_png(message, serial: str, kind: str, data: bytes) -> None:
+    """Отправить PNG, переиспользуя file_id Telegram для повторных серийников."""
+    key = (serial, kind)
+    filename = f"{serial}_{kind}.png"
+
+    file_id = _FILE_ID_CACHE.pop(key, None)
+    if file_id:
+        _FILE_ID_CACHE[key] = file_id  # LRU: недавние серийники вытесняются последними
+        try:
+            await message.reply_document(document=file_id, filename=filename)
+            return
+        except Exception:
+            # file_id мог протухнуть — падаем на обычную загрузку
+            _FILE_ID_CACHE.pop(key, None)
+
+    msg = await message.reply_document(document=io.BytesIO(data), filename=filename)
+    if msg.document:
+        if len(_FILE_ID_CACHE) >= _FILE_ID_CACHE_MAX:
+            _FILE_ID_CACHE.pop(next(iter(_FILE_ID_CACHE)))
+        _FILE_ID_CACHE[key] = msg.document.file_id
+
+
 async def callback_send_to_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     t0 = time.monotonic()
     query = update.callback_query
@@ -124,42 +184,38 @@ async def callback_send_to_chat(update: Update, context: ContextTypes.DEFAULT_TY
     serial = context.user_data.get("serial")
     if not serial:
         await query.answer("Серийный номер не найден, отправь его снова", show_alert=True)
-        if metricon:
-            metricon.track_request("/send_to_chat", int((time.monotonic() - t0) * 1000),
-                                   str(update.effective_user.id), success=False)
+        _track("/send_to_chat", t0, update, success=False)
         return
 
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
     try:
-        qr_buf, bar_buf = await asyncio.gather(
-            loop.run_in_executor(None, generate_qr, serial),
-            loop.run_in_executor(None, generate_barcode, serial),
-        )
+        qr_bytes, bar_bytes = await loop.run_in_executor(_POOL, generate_both, serial)
     except Exception as exc:
         logger.error("Generation error: %s", exc)
         await query.message.reply_text(f"Ошибка генерации: {exc}")
-        if metricon:
-            metricon.track_request("/send_to_chat", int((time.monotonic() - t0) * 1000),
-                                   str(update.effective_user.id), success=False)
-            metricon.track_error(exc, command="/send_to_chat")
+        _track("/send_to_chat", t0, update, success=False, exc=exc)
         return
 
-    await query.message.reply_document(document=qr_buf, filename=f"{serial}_qr.png")
-    await query.message.reply_document(document=bar_buf, filename=f"{serial}_barcode.png")
-    if metricon:
-        metricon.track_request("/send_to_chat", int((time.monotonic() - t0) * 1000),
-                               str(update.effective_user.id), success=True)
+    await _send_png(query.message, serial, "qr", qr_bytes)
+    await _send_png(query.message, serial, "barcode", bar_bytes)
+    _track("/send_to_chat", t0, update, success=True)
 
 
 def main() -> None:
     if not BOT_TOKEN:
         raise RuntimeError("BOT_TOKEN не задан. Создайте файл .env с BOT_TOKEN=...")
 
+    if uvloop is not None:
+        uvloop.install()
+        logger.info("uvloop установлен как event loop")
+
     if metricon:
         metricon.start()
         logger.info("Metricon мониторинг запущен (bot=SN-print)")
 
-    app = Application.builder().token(BOT_TOKEN).build()
+    # concurrent_updates: хендлеры разных апдейтов идут параллельно —
+    # долгий reply_document не блокирует чужие /start
+    app = Application.builder().token(BOT_TOKEN).concurrent_updates(True).build()
     app.add_handler(CommandHandler("start", cmd_start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_serial))
     app.add_handler(CallbackQueryHandler(callback_send_to_chat, pattern="^send_to_chat$"))
@@ -1,6 +1,7 @@
+import functools
 import io
 import textwrap
-import qrcode
+import segno
 import barcode
 from barcode.writer import ImageWriter
 from PIL import Image, ImageDraw, ImageFont
@@ -8,10 +9,20 @@ from PIL import Image, ImageDraw, ImageFont
 RENDER_SIZE = 900  # внутренний размер рендера для качества
 
 
+_FONT_NAME: str | None = None  # найденный файл шрифта, чтобы не перебирать заново
+
+
+@functools.lru_cache(maxsize=32)
 def _get_font(size: int):
+    """Парсинг TTF стоит миллисекунды — держим объекты шрифтов в кэше."""
+    global _FONT_NAME
+    if _FONT_NAME is not None:
+        return ImageFont.truetype(_FONT_NAME, size)
     for name in ["cour.ttf", "courbd.ttf", "DejaVuSansMono.ttf", "arial.ttf"]:
         try:
-            return ImageFont.truetype(name, size)
+            font = ImageFont.truetype(name, size)
+            _FONT_NAME = name
+            return font
         except OSError:
             continue
     return ImageFont.load_default()
@@ -25,58 +36,106 @@ def _add_serial(img: Image.Image, text: str) -> Image.Image:
 
     avg_char_w = font_size * 0.62
     max_chars = max(1, int(w / avg_char_w))
-    lines = textwrap.wrap(text, width=max_chars) or [text]
+    # Обычный серийник помещается в одну строку — textwrap не нужен
+    if len(text) <= max_chars:
+        lines = [text]
+    else:
+        lines = textwrap.wrap(text, width=max_chars) or [text]
 
     line_h = int(font_size * 1.35)
     pad = font_size
     text_h = line_h * len(lines) + pad
 
-    result = Image.new("RGB", (w, img.height + text_h), "white")
+    result = Image.new("L", (w, img.height + text_h), "white")
     result.paste(img, (0, 0))
 
+    # Один вызов Pillow на весь блок — один проход шейпинга freetype,
+    # вместо textbbox + text на каждую строку
     draw = ImageDraw.Draw(result)
-    y = img.height + pad // 2
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font)
-        lw = bbox[2] - bbox[0]
-        draw.text(((w - lw) // 2, y), line, fill="black", font=font)
-        y += line_h
+    block = "\n".join(lines)
+    spacing = line_h - font_size
+    bbox = draw.multiline_textbbox((0, 0), block, font=font, spacing=spacing)
+    bw = bbox[2] - bbox[0]
+    draw.multiline_text(
+        ((w - bw) // 2, img.height + pad // 2), block,
+        fill="black", font=font, align="center", spacing=spacing,
+    )
 
     return result
 
 
-def generate_qr(data: str) -> io.BytesIO:
-    qr = qrcode.QRCode(
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=10,
-        border=2,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-    img = img.resize((RENDER_SIZE, RENDER_SIZE), Image.LANCZOS)
+@functools.lru_cache(maxsize=512)
+def _generate_qr_bytes(data: str) -> bytes:
+    # segno кодирует в разы быстрее чистопитоновского qrcode;
+    # micro=False — Micro QR читают не все сканеры.
+    qr = segno.make(data, error="m", boost_error=False, micro=False)
+    # Масштаб подбираем так, чтобы растр сразу вышел ~RENDER_SIZE —
+    # без дорогого LANCZOS-ресайза поверх двухуровневой картинки
+    modules, _ = qr.symbol_size(scale=1, border=2)
+    scale = max(1, RENDER_SIZE // modules)
+    raw = io.BytesIO()
+    qr.save(raw, kind="png", scale=scale, border=2)
+    raw.seek(0)
+    # PNG от segno уже двухуровневый — paste сам приведёт его к L-холсту
+    img = Image.open(raw)
     result = _add_serial(img, data)
 
     buf = io.BytesIO()
-    result.save(buf, format="PNG", dpi=(300, 300))
-    buf.seek(0)
-    return buf
+    # Картинка двухуровневая — адаптивные PNG-фильтры и сильное сжатие не окупаются
+    result.save(buf, format="PNG", dpi=(300, 300), optimize=False, compress_level=1)
+    return buf.getvalue()
 
 
-def generate_barcode(data: str) -> io.BytesIO:
-    writer = ImageWriter()
-    code128 = barcode.get("code128", data, writer=writer)
-    raw = io.BytesIO()
-    code128.write(raw, options={"write_text": False, "dpi": 300})
-    raw.seek(0)
+def generate_qr(data: str) -> io.BytesIO:
+    """Сканеры часто повторяют один серийник — PNG кэшируется, BytesIO всегда свежий."""
+    return io.BytesIO(_generate_qr_bytes(data))
+
 
-    img = Image.open(raw).convert("RGB")
-    aspect = img.height / img.width
-    render_h = int(RENDER_SIZE * aspect)
-    img = img.resize((RENDER_SIZE, render_h), Image.LANCZOS)
+@functools.lru_cache(maxsize=512)
+def _generate_barcode_bytes(data: str) -> bytes:
+    writer = ImageWriter(mode="L")  # сразу серый холст вместо RGB + convert
+    code128 = barcode.get("code128", data, writer=writer)
+    # Ширину модуля считаем так, чтобы растр сразу вышел ~RENDER_SIZE
+    # по ширине (поля 6.5 мм с каждой стороны — дефолт ImageWriter)
+    modules = len(code128.build()[0])
+    quiet_zone = 6.5
+    target_mm = RENDER_SIZE / 300 * 25.4
+    module_width = (target_mm - 2 * quiet_zone) / modules
+    # render() отдаёт PIL Image напрямую — без промежуточного PNG
+    # encode/decode через BytesIO
+    img = code128.render({
+        "write_text": False,
+        "dpi": 300,
+        "module_width": module_width,
+        # Высоту тянем пропорционально ширине — те же пропорции,
+        # что давал старый равномерный ресайз
+        "module_height": 15.0 * module_width / 0.2,
+        "quiet_zone": quiet_zone,
+    })
     result = _add_serial(img, data)
 
     buf = io.BytesIO()
-    result.save(buf, format="PNG", dpi=(300, 300))
-    buf.seek(0)
-    return buf
+    # Картинка двухуровневая — адаптивные PNG-фильтры и сильное сжатие не окупаются
+    result.save(buf, format="PNG", dpi=(300, 300), optimize=False, compress_level=1)
+    return buf.getvalue()
+
+
+def generate_barcode(data: str) -> io.BytesIO:
+    """Telegram читает поток до конца, поэтому возвращаем новый BytesIO поверх кэша."""
+    return io.BytesIO(_generate_barcode_bytes(data))
+
+
+def generate_both(data: str) -> tuple[bytes, bytes]:
+    """QR и штрихкод одним вызовом — одна отправка в пул процессов вместо двух."""
+    return _generate_qr_bytes(data), _generate_barcode_bytes(data)
+
+
+def warmup() -> None:
+    """Прогрев воркера пула: шрифт, плагины PIL и по одной пробной генерации.
+
+    Вызывается из initializer ProcessPoolExecutor, чтобы первый реальный
+    запрос воркера не платил за холодный старт.
+    """
+    _get_font(max(28, RENDER_SIZE // 13))
+    _generate_qr_bytes("WARMUP")
+    _generate_barcode_bytes("WARMUP")
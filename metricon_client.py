@@ -34,18 +34,47 @@ from __future__ import annotations
 
 VERSION = "1.1.0"
 
-import asyncio
+import collections
 import functools
-import hashlib
-import inspect
 import logging
+import os
+import queue
+import sys
 import threading
 import time
-import traceback
 from typing import Any, Callable, Optional
 
+# inspect, hashlib and traceback are imported lazily at first use — they pull
+# in sizeable dependency trees (dis, linecache, ...) that importers of this
+# module shouldn't pay for at cold start.
+
 log = logging.getLogger("metricon_client")
 
+# Sentinels for the background worker queue
+_FLUSH = object()   # drain the pending batch now
+_STOP = object()    # shut the worker down
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 0  # non-POSIX — fall back to psutil for memory
+
+
+def _rss_mb() -> float:
+    """Resident set size in MiB straight from /proc/self/statm (Linux).
+
+    One small read and a split — much cheaper than psutil's memory_info,
+    which parses several /proc files and builds namedtuples.
+    Returns 0.0 where /proc is unavailable.
+    """
+    if not _PAGE_SIZE:
+        return 0.0
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
 # ---------------------------------------------------------------------------
 # Optional dependencies
 # ---------------------------------------------------------------------------
@@ -59,6 +88,11 @@ try:
 except ImportError:
     _psutil = None  # type: ignore
 
+try:
+    import orjson as _orjson  # C serializer, ~3-5x faster than stdlib json
+except ImportError:
+    _orjson = None  # type: ignore
+
 
 # ---------------------------------------------------------------------------
 # MetriconClient
@@ -73,6 +107,8 @@ class MetriconClient:
     HEARTBEAT_INTERVAL = 30   # seconds
     BATCH_INTERVAL = 5        # seconds
     MAX_BATCH_SIZE = 50       # force-flush threshold
+    MAX_PENDING = 10_000      # hard cap on queued events (server down)
+    CONNECTIONS_EVERY = 4     # sample net_connections() every N-th heartbeat
 
     def __init__(
         self,
@@ -89,13 +125,42 @@ class MetriconClient:
         self.bot_name = bot_name
         self.timeout = timeout
 
-        self._lock = threading.Lock()
-        self._batch: list[dict] = []
+        # Endpoint URLs built once — no string concat per event
+        self._url_batch = self.server_url + "/api/v1/metrics/request/batch/"
+        self._url_error = self.server_url + "/api/v1/metrics/error/"
+        self._url_custom = self.server_url + "/api/v1/metrics/custom/"
+        self._url_heartbeat = self.server_url + "/api/v1/bots/heartbeat/"
+
+        # One keep-alive session — no DNS/TCP/TLS handshake per event
+        self._session = _requests.Session()
+        self._session.headers.update(self._headers())
+        adapter = _requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=8,
+            max_retries=_requests.adapters.Retry(total=2, backoff_factor=0.1),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # deque.append/popleft are atomic under the GIL — no lock on the hot
+        # path; maxlen makes it a ring buffer so an unreachable server drops
+        # the oldest events instead of growing RSS forever
+        self._batch: collections.deque = collections.deque(maxlen=self.MAX_PENDING)
+        self._dropped = 0
+        # Fingerprint -> pending error entry, for deduping tight error loops
+        self._err_seen: dict[bytes, dict] = {}
+        self._flush_inflight = False  # a force-flush is already scheduled
         self._running = False
+        self._stop_evt = threading.Event()
+        # One persistent worker drains this queue — no thread-per-event
+        self._outq: queue.SimpleQueue = queue.SimpleQueue()
         self._heartbeat_thread: Optional[threading.Thread] = None
         self._flush_thread: Optional[threading.Thread] = None
+        self._worker_thread: Optional[threading.Thread] = None
         self._process = _psutil.Process() if _psutil else None
         self._start_time = time.time()
+        self._hb_seq = 0          # heartbeat counter for subsampled probes
+        self._conn_count = 0      # last sampled net_connections() result
         # Prime cpu_percent so the first real reading isn't always 0.0
         if self._process:
             try:
@@ -112,6 +177,7 @@ class MetriconClient:
         if self._running:
             return self
         self._running = True
+        self._stop_evt.clear()
 
         self._heartbeat_thread = threading.Thread(
             target=self._heartbeat_loop, name="metricon-heartbeat", daemon=True
@@ -119,15 +185,26 @@ class MetriconClient:
         self._flush_thread = threading.Thread(
             target=self._flush_loop, name="metricon-flush", daemon=True
         )
+        self._worker_thread = threading.Thread(
+            target=self._worker_loop, name="metricon-worker", daemon=True
+        )
         self._heartbeat_thread.start()
         self._flush_thread.start()
+        self._worker_thread.start()
         log.info("MetriconClient started for bot=%s", self.bot_name)
         return self
 
     def stop(self) -> None:
-        """Gracefully stop: flush remaining batch, then shut down threads."""
+        """Gracefully stop: wake the loops, join them, then do a final flush."""
         self._running = False
+        self._stop_evt.set()
+        self._outq.put(_STOP)
+        # Joining first means no in-flight POST races with the final flush
+        for thread in (self._flush_thread, self._heartbeat_thread, self._worker_thread):
+            if thread is not None:
+                thread.join(timeout=2)
         self._flush_batch()
+        self._session.close()
         log.info("MetriconClient stopped for bot=%s", self.bot_name)
 
     # ------------------------------------------------------------------
@@ -142,38 +219,77 @@ class MetriconClient:
         from ``update.effective_user.id`` (python-telegram-bot style) if present.
         Falls back to "anonymous".
         """
-        command = f"/{fn.__name__}"
+        import inspect
+
+        command = sys.intern(f"/{fn.__name__}")
+        # Bind everything the wrapper touches as closure locals once, at
+        # decoration time — no self./module attribute lookups per call
+        track_request = self.track_request
+        track_error = self.track_error
+        monotonic_ns = time.monotonic_ns  # int result, no float boxing per call
+
+        # Specialize the user-id extractor from the signature, also at
+        # decoration time — handlers with a known parameter layout skip the
+        # generic argument probing on every call
+        try:
+            params = list(inspect.signature(fn).parameters)
+        except (TypeError, ValueError):
+            params = []
+        if "update" in params:
+            update_idx = params.index("update")
+
+            def extract_user_id(args, kwargs, _idx=update_idx):
+                if len(args) > _idx:
+                    user = getattr(args[_idx], "effective_user", None)
+                    if user is not None:
+                        return str(user.id)
+                return _extract_user_id(args, kwargs)
+        elif "user_id" in params:
+            user_idx = params.index("user_id")
+
+            def extract_user_id(args, kwargs, _idx=user_idx):
+                if "user_id" in kwargs:
+                    return str(kwargs["user_id"])
+                if len(args) > _idx:
+                    return str(args[_idx])
+                return "anonymous"
+        else:
+            extract_user_id = _extract_user_id
 
         if inspect.iscoroutinefunction(fn):
             @functools.wraps(fn)
             async def async_wrapper(*args, **kwargs):
-                user_id = _extract_user_id(args, kwargs)
-                t0 = time.monotonic()
+                user_id = extract_user_id(args, kwargs)
+                t0 = monotonic_ns()
+                ok = False
                 try:
                     result = await fn(*args, **kwargs)
-                    ms = int((time.monotonic() - t0) * 1000)
-                    self.track_request(command, ms, user_id, success=True)
+                    ok = True
                     return result
                 except Exception as exc:
-                    ms = int((time.monotonic() - t0) * 1000)
-                    self.track_request(command, ms, user_id, success=False)
-                    self.track_error(exc, command=command)
+                    track_error(exc, command=command)
                     raise
+                finally:
+                    # On the event-loop thread this is one deque append —
+                    # flushing is the background worker's job, so a burst of
+                    # handlers never spawns threads or takes locks here
+                    ms = (monotonic_ns() - t0) // 1_000_000
+                    track_request(command, ms, user_id, success=ok)
             return async_wrapper
         else:
             @functools.wraps(fn)
             def sync_wrapper(*args, **kwargs):
-                user_id = _extract_user_id(args, kwargs)
-                t0 = time.monotonic()
+                user_id = extract_user_id(args, kwargs)
+                t0 = monotonic_ns()
                 try:
                     result = fn(*args, **kwargs)
-                    ms = int((time.monotonic() - t0) * 1000)
-                    self.track_request(command, ms, user_id, success=True)
+                    ms = (monotonic_ns() - t0) // 1_000_000
+                    track_request(command, ms, user_id, success=True)
                     return result
                 except Exception as exc:
-                    ms = int((time.monotonic() - t0) * 1000)
-                    self.track_request(command, ms, user_id, success=False)
-                    self.track_error(exc, command=command)
+                    ms = (monotonic_ns() - t0) // 1_000_000
+                    track_request(command, ms, user_id, success=False)
+                    track_error(exc, command=command)
                     raise
             return sync_wrapper
 
@@ -184,42 +300,62 @@ class MetriconClient:
         user_id: str = "anonymous",
         success: bool = True,
     ) -> None:
-        """Add a request log to the pending batch."""
-        entry = {
-            "command": command,
-            "user_id": str(user_id),
-            "response_time_ms": max(0, int(response_time_ms)),
-            "success": bool(success),
-        }
-        with self._lock:
-            self._batch.append(entry)
-            should_flush = len(self._batch) >= self.MAX_BATCH_SIZE
+        """Add a request log to the pending batch.
 
-        if should_flush:
-            threading.Thread(
-                target=self._flush_batch, name="metricon-flush-force", daemon=True
-            ).start()
+        Pending records are tuples, not dicts — roughly half the allocation
+        cost and memory per queued event; the wire dicts are built at flush.
+        """
+        self._append(("request", (
+            # A bot has a handful of commands — interning makes every queued
+            # record share one str object instead of holding copies
+            sys.intern(command),
+            str(user_id),
+            max(0, int(response_time_ms)),
+            bool(success),
+        )))
 
     def track_error(self, exc: Exception, command: str = "") -> None:
-        """Fire-and-forget error event."""
-        payload = {
-            "error_type": type(exc).__name__,
-            "message": str(exc),
-            "traceback": traceback.format_exc(),
-            "command": command,
-        }
-        threading.Thread(
-            target=self._post_json, args=("/api/v1/metrics/error/", payload),
-            name="metricon-error", daemon=True
-        ).start()
+        """Fire-and-forget error event — shipped with the next batch flush.
+
+        Only the exception reference is captured here; the traceback is
+        formatted on the flush thread, off the caller's hot path. A handler
+        crashing in a loop raises the same error thousands of times — within
+        one flush window identical errors collapse into a single entry
+        whose count is bumped instead of queueing N copies.
+        """
+        import hashlib
+
+        frame = ""
+        tb = exc.__traceback__
+        if tb is not None:
+            frame = f"{tb.tb_frame.f_code.co_filename}:{tb.tb_lineno}"
+        fingerprint = hashlib.blake2b(
+            f"{type(exc).__name__}|{str(exc)[:200]}|{frame}|{command}".encode(),
+            digest_size=8,
+        ).digest()
+
+        entry = self._err_seen.get(fingerprint)
+        if entry is not None:
+            entry["count"] += 1
+            return
+        entry = {"exc": exc, "command": command, "count": 1}
+        self._err_seen[fingerprint] = entry
+        self._append(("error", entry))
 
     def track_metric(self, key: str, value: float) -> None:
-        """Fire-and-forget custom metric."""
+        """Fire-and-forget custom metric — shipped with the next batch flush."""
         payload = {"key": key, "value": float(value)}
-        threading.Thread(
-            target=self._post_json, args=("/api/v1/metrics/custom/", payload),
-            name="metricon-custom", daemon=True
-        ).start()
+        self._append(("metric", payload))
+
+    def _append(self, item: tuple) -> None:
+        if len(self._batch) == self.MAX_PENDING:
+            self._dropped += 1  # the ring buffer evicts the oldest entry
+        self._batch.append(item)
+        # Only the first over-threshold event schedules a flush — sustained
+        # load no longer queues one sentinel per appended event
+        if len(self._batch) >= self.MAX_BATCH_SIZE and not self._flush_inflight:
+            self._flush_inflight = True
+            self._outq.put(_FLUSH)
 
     # ------------------------------------------------------------------
     # Class method: first-time registration
@@ -242,11 +378,25 @@ class MetriconClient:
             raise ImportError("Install 'requests': pip install requests")
 
         url = server_url.rstrip("/") + "/api/v1/bots/register/"
-        resp = _requests.post(
-            url,
-            json={"name": name, "description": description},
-            timeout=10,
+        # A transient blip shouldn't force the user to re-run the CLI:
+        # retry 5xx with backoff at the urllib3 layer (POST is not retried
+        # by default, so it must be allowed explicitly)
+        adapter = _requests.adapters.HTTPAdapter(
+            max_retries=_requests.adapters.Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=["POST"],
+            )
         )
+        with _requests.Session() as session:
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            resp = session.post(
+                url,
+                json={"name": name, "description": description},
+                timeout=10,
+            )
         resp.raise_for_status()
         data = resp.json()
         api_key = data["api_key"]
@@ -260,50 +410,123 @@ class MetriconClient:
     def _headers(self) -> dict:
         return {"X-API-Key": self.api_key, "Content-Type": "application/json"}
 
-    def _post_json(self, path: str, payload: Any) -> Optional[dict]:
+    def _post_json(self, url: str, payload: Any) -> Optional[dict]:
         try:
-            resp = _requests.post(
-                self.server_url + path,
-                json=payload,
-                headers=self._headers(),
-                timeout=self.timeout,
-            )
+            if _orjson is not None:
+                # Content-Type is already set on the session headers
+                resp = self._session.post(
+                    url,
+                    data=_orjson.dumps(payload),
+                    timeout=self.timeout,
+                )
+            else:
+                resp = self._session.post(
+                    url,
+                    json=payload,
+                    timeout=self.timeout,
+                )
             return resp.json() if resp.ok else None
         except Exception as exc:
-            log.debug("Metricon POST %s failed: %s", path, exc)
+            log.debug("Metricon POST %s failed: %s", url, exc)
             return None
 
     def _flush_batch(self) -> None:
-        with self._lock:
-            if not self._batch:
-                return
-            batch = self._batch[:]
-            self._batch.clear()
+        # Atomic popleft-drain: concurrent flushers each take distinct entries
+        batch = []
+        try:
+            while True:
+                batch.append(self._batch.popleft())
+        except IndexError:
+            pass
+        if not batch:
+            self._flush_inflight = False
+            return
 
-        self._post_json("/api/v1/metrics/request/batch/", {"logs": batch})
+        try:
+            self._ship(batch)
+        finally:
+            # Cleared after the POSTs return so a burst never schedules more
+            # than one force-flush at a time
+            self._flush_inflight = False
+
+    def _ship(self, batch: list) -> None:
+        import traceback
+
+        # Request logs go out as one batched POST; errors/metrics keep their
+        # single-event endpoints but ride the same flush cadence.
+        logs = [
+            {
+                "command": rec[0],
+                "user_id": rec[1],
+                "response_time_ms": rec[2],
+                "success": rec[3],
+            }
+            for kind, rec in batch if kind == "request"
+        ]
+        if logs:
+            self._post_json(self._url_batch, {"logs": logs})
+        # Drained error entries leave the dedupe window; later repeats of the
+        # same error start a fresh aggregated entry
+        self._err_seen.clear()
+        for kind, data in batch:
+            if kind == "error":
+                exc = data["exc"]
+                payload = {
+                    "error_type": type(exc).__name__,
+                    "message": str(exc),
+                    # Formatted here, capped to the top frames — deep stacks
+                    # no longer cost the caller kilobytes of string building
+                    "traceback": "".join(traceback.format_exception(exc, limit=20)),
+                    "command": data["command"],
+                    "count": data["count"],
+                }
+                self._post_json(self._url_error, payload)
+            elif kind == "metric":
+                self._post_json(self._url_custom, data)
 
     def _heartbeat_loop(self) -> None:
-        while self._running:
+        # Event.wait doubles as the sleep — stop() wakes the loop immediately
+        # instead of waiting out the remainder of the interval
+        while True:
             self._send_heartbeat()
-            time.sleep(self.HEARTBEAT_INTERVAL)
+            if self._stop_evt.wait(self.HEARTBEAT_INTERVAL):
+                break
 
     def _flush_loop(self) -> None:
-        while self._running:
-            time.sleep(self.BATCH_INTERVAL)
+        while not self._stop_evt.wait(self.BATCH_INTERVAL):
             self._flush_batch()
 
+    def _worker_loop(self) -> None:
+        """Single persistent consumer for all fire-and-forget events."""
+        while True:
+            item = self._outq.get()
+            if item is _STOP:
+                break
+            if item is _FLUSH:
+                self._flush_batch()
+                continue
+            url, payload = item
+            self._post_json(url, payload)
+
     def _send_heartbeat(self) -> None:
         cpu = 0.0
-        memory_mb = 0.0
-        connections = 0
+        memory_mb = _rss_mb()
 
         if _psutil and self._process:
             try:
-                cpu = self._process.cpu_percent(interval=None)  # process-only CPU
-                memory_mb = self._process.memory_info().rss / (1024 * 1024)
-                connections = len(self._process.net_connections())
+                # oneshot() reads /proc/<pid>/stat once for both attributes
+                with self._process.oneshot():
+                    cpu = self._process.cpu_percent(interval=None)  # process-only CPU
+                    if not memory_mb:  # non-Linux fallback
+                        memory_mb = self._process.memory_info().rss / (1024 * 1024)
+                # net_connections() walks /proc/<pid>/net/* and can take tens
+                # of ms on busy hosts — sample it only every N-th heartbeat
+                if self._hb_seq % self.CONNECTIONS_EVERY == 0:
+                    self._conn_count = len(self._process.net_connections())
             except Exception:
                 pass
+        self._hb_seq += 1
+        connections = self._conn_count
 
         uptime = int(time.time() - self._start_time)  # bot uptime, not system uptime
 
@@ -312,9 +535,10 @@ class MetriconClient:
             "cpu_percent": round(cpu, 2),
             "memory_mb": round(memory_mb, 2),
             "active_connections": connections,
+            "dropped_events": self._dropped,
             "client_version": VERSION,
         }
-        response_data = self._post_json("/api/v1/bots/heartbeat/", payload)
+        response_data = self._post_json(self._url_heartbeat, payload)
         if response_data:
             self._check_for_update(response_data)
 
@@ -360,11 +584,13 @@ def _extract_user_id(args: tuple, kwargs: dict) -> str:
         return str(kwargs["user_id"])
 
     # python-telegram-bot: update.effective_user.id
+    # getattr probing — no exception construction on non-telegram callers
     for arg in args:
-        try:
-            return str(arg.effective_user.id)
-        except AttributeError:
-            pass
+        user = getattr(arg, "effective_user", None)
+        if user is not None:
+            uid = getattr(user, "id", None)
+            if uid is not None:
+                return str(uid)
 
     # First positional string argument (heuristic)
     for arg in args: